@@ -1,3 +1,5 @@
+import os
+
 HORIZONTAL_ANGLES = [-135, -90, -45, 0, 45, 90, 135, 180]
 VERTICAL_ANGLES = [-45, 0, 45]
 
@@ -5,6 +7,21 @@ MAX_PREVIEWS = 24
 BEFORE_PREVIEW_SIZE = (640, 320)
 AFTER_PREVIEW_SIZE = (240, 240)
 
+# サムネイル読み込み (ワーカースレッド数 / キャッシュ上限 / UIへの反映間隔ms)
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_CACHE_SIZE = 64
+THUMBNAIL_POLL_MS = 50
+
+# 動き適応サンプリング (解析用の縮小サイズ / 解析FPS / ノイズとして無視する差分量)
+MOTION_ANALYSIS_SIZE = (64, 32)
+MOTION_ANALYSIS_FPS = 5
+MOTION_NOISE_FLOOR = 1.0
+# select式に含める時刻数の上限
+MAX_SELECTED_FRAMES = 10000
+
+# 魚眼レンズプロファイルの保存先
+LENS_PROFILE_PATH = os.path.join(os.path.expanduser("~"), ".v360-align-prep", "lens_profiles.json")
+
 # ボタンカラー定義
 COLOR_PREVIEW_NORMAL = "#1f538d"
 COLOR_PREVIEW_HOVER = "#14375e"
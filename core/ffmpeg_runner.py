@@ -23,6 +23,23 @@ class FFmpegRunner:
             return int(h) * 3600 + int(m) * 60 + float(s)
         return 0.0
 
+    @staticmethod
+    def get_video_streams(video_path):
+        """映像ストリームの解像度 [(幅, 高さ), ...] を取得する"""
+        cmd = ['ffmpeg', '-i', video_path]
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        process = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace', creationflags=creationflags)
+
+        # Stream #0:0[0x1](und): Video: h264 (High) ..., yuv420p(...), 3840x1920 [SAR 1:1 DAR 2:1], ... などを探す
+        streams = []
+        for line in process.stderr.splitlines():
+            if 'Video:' not in line or 'attached pic' in line:
+                continue
+            match = re.search(r"Stream #\d+:\d+.*?Video:.*?, (\d{2,5})x(\d{2,5})", line)
+            if match:
+                streams.append((int(match.group(1)), int(match.group(2))))
+        return streams
+
     @staticmethod
     def run_sync(command, description="FFmpeg", logger=None):
         try:
@@ -0,0 +1,476 @@
+import os
+import json
+import signal
+import threading
+import time
+import uuid
+import traceback
+from core.processor import VideoProcessor
+from core.ffmpeg_runner import FFmpegRunner
+from core.projection import load_lens_profiles, validate_lens, INPUT_TYPES, DEFAULT_LENS_PROFILE
+
+VIDEO_EXTENSIONS = ('.mov', '.mp4')
+
+# GUIの初期値と同じ処理設定
+DEFAULT_SETTINGS = {
+    'input_type': 'e',
+    'lens_profile': DEFAULT_LENS_PROFILE,
+    'lut_path': '',
+    'fov': 90.0,
+    'size': 1920,
+    'fps': "1.0",
+    'adaptive_sampling': False,
+    'motion_threshold': 10.0,
+    'min_interval': 0.25,
+    'max_interval': 5.0,
+    'saturation': 1.0,
+    'contrast': 1.0,
+    'brightness': 0.0,
+    'gamma': 1.0,
+    'angles': [[-90, 0], [0, 0], [90, 0], [180, 0]],
+}
+
+DEFAULT_CONFIG = {
+    'queue_file': "ingest_queue.json",
+    'status_file': "ingest_status.json",
+    'max_concurrent': 1,
+    'poll_interval': 5.0,
+    'stable_seconds': 30.0,
+    'max_finished_jobs': 200,
+    'presets': {},
+    'folders': [],
+}
+
+
+def write_json_atomic(path, data, retries=5):
+    """一時ファイルに書いてから置き換えることで、途中で落ちても壊れないようにする"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Windowsでは他のプロセスが開いている間は置き換えに失敗するため、少し待って再試行する
+    for attempt in range(retries):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+
+def load_config(config_path):
+    with open(config_path, encoding='utf-8') as f:
+        config = {**DEFAULT_CONFIG, **json.load(f)}
+
+    # 相対パスは設定ファイルの場所を基準にする
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    for key in ('queue_file', 'status_file'):
+        config[key] = os.path.join(base_dir, config[key])
+
+    # 設定の誤りは起動時に検出する
+    for name, preset in config['presets'].items():
+        try:
+            build_job_settings(preset)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"プリセット '{name}' の設定が不正です: {e}")
+
+    folders = []
+    for folder in config['folders']:
+        if isinstance(folder, str):
+            folder = {'path': folder}
+        preset_name = folder.get('preset')
+        if preset_name and preset_name not in config['presets']:
+            raise ValueError(f"プリセットが見つかりません: {preset_name}")
+        folders.append({
+            'path': os.path.join(base_dir, folder['path']),
+            'preset': preset_name,
+            'priority': int(folder.get('priority', 0)),
+        })
+    if not folders:
+        raise ValueError("監視フォルダが設定されていません。")
+    config['folders'] = folders
+    return config
+
+
+def build_job_settings(preset):
+    """プリセットから VideoProcessor に渡す設定と視点リストを作る"""
+    settings = {**DEFAULT_SETTINGS, **(preset or {})}
+    transforms = [(int(a[0]), int(a[1]), int(a[2]) if len(a) > 2 else 0) for a in settings.pop('angles')]
+    settings['size'] = int(settings['size'])
+    if settings['input_type'] not in INPUT_TYPES:
+        raise ValueError(f"入力形式が不正です: {settings['input_type']} (指定可能: {', '.join(INPUT_TYPES)})")
+    # レンズはプリセットに直接書くか、保存済みプロファイル名で指定する
+    lens_profile = settings.pop('lens_profile')
+    if 'lens' not in settings and settings['input_type'] != 'e':
+        profiles = load_lens_profiles()
+        if lens_profile not in profiles:
+            raise ValueError(f"レンズプロファイルが見つかりません: {lens_profile}")
+        settings['lens'] = profiles[lens_profile]
+    if settings['input_type'] != 'e':
+        err = validate_lens(settings['lens'])
+        if err:
+            raise ValueError(err)
+    settings['fps'] = str(settings['fps'])
+    return settings, transforms
+
+
+def is_file_complete(video_path):
+    """書き込み中でないかを確認する。
+    末尾にmoovを書く動画は書き込み完了まで再生時間を読めないことを利用する。
+    Windowsでは書き込み側が開いている間は書き込み用に開けないため、書き込み可能なファイルに限りそれも確認する"""
+    if os.name == 'nt' and os.access(video_path, os.W_OK):
+        try:
+            with open(video_path, 'r+b'):
+                pass
+        except OSError:
+            return False
+    return FFmpegRunner.get_video_duration(video_path) > 0
+
+
+class JobQueue:
+    """ディスクに永続化される優先度付きジョブキュー。
+    終了したジョブは max_finished_jobs 件を超えた古いものからアーカイブ (JSON Lines) に移す"""
+    def __init__(self, queue_path, max_finished_jobs=200, logger=None):
+        self.queue_path = queue_path
+        self.archive_path = f"{os.path.splitext(queue_path)[0]}_archive.jsonl"
+        self.max_finished_jobs = max_finished_jobs
+        self.logger = logger or print
+        self.lock = threading.Lock()
+        self.jobs = []
+        # 重複登録の判定用 (アーカイブ済みでもファイルが残っているものは再登録しない)
+        self.file_keys = set()
+        self.archived_counts = {'done': 0, 'failed': 0}
+        if os.path.exists(queue_path):
+            with open(queue_path, encoding='utf-8') as f:
+                self.jobs = json.load(f)
+        if os.path.exists(self.archive_path):
+            with open(self.archive_path, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    job = json.loads(line)
+                    self.archived_counts[job['status']] = self.archived_counts.get(job['status'], 0) + 1
+                    if os.path.exists(job['video_path']):
+                        self.file_keys.add(job['file_key'])
+        # 前回実行中のまま終了したジョブはやり直す
+        for job in self.jobs:
+            self.file_keys.add(job['file_key'])
+            if job['status'] == 'running':
+                job['status'] = 'queued'
+                job['started_at'] = None
+        self._prune()
+        self._save()
+
+    def _save(self):
+        # 保存に失敗してもメモリ上の状態が正なので、次回の更新時に改めて書き出す
+        try:
+            write_json_atomic(self.queue_path, self.jobs)
+        except OSError as e:
+            self.logger(f"キューの保存に失敗しました: {e}")
+
+    def _prune(self):
+        finished = [job for job in self.jobs if job['status'] in ('done', 'failed')]
+        excess = len(finished) - self.max_finished_jobs
+        if excess <= 0:
+            return
+        finished.sort(key=lambda j: j['finished_at'] or 0)
+        archived = finished[:excess]
+        try:
+            with open(self.archive_path, 'a', encoding='utf-8') as f:
+                for job in archived:
+                    f.write(json.dumps(job, ensure_ascii=False) + "\n")
+        except OSError as e:
+            self.logger(f"終了ジョブのアーカイブに失敗しました: {e}")
+            return
+        for job in archived:
+            self.archived_counts[job['status']] += 1
+        archived_ids = {job['id'] for job in archived}
+        self.jobs = [job for job in self.jobs if job['id'] not in archived_ids]
+
+    def contains(self, file_key):
+        with self.lock:
+            return file_key in self.file_keys
+
+    def enqueue(self, video_path, file_key, folder):
+        with self.lock:
+            job = {
+                'id': uuid.uuid4().hex,
+                'video_path': video_path,
+                'file_key': file_key,
+                'folder': folder['path'],
+                'preset': folder['preset'],
+                'priority': folder['priority'],
+                'status': 'queued',
+                'enqueued_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+            }
+            self.jobs.append(job)
+            self.file_keys.add(file_key)
+            self._save()
+            return job
+
+    def take_next(self):
+        """優先度が高く、古いものから順にジョブを取り出して実行中にする"""
+        with self.lock:
+            queued = [job for job in self.jobs if job['status'] == 'queued']
+            if not queued:
+                return None
+            job = min(queued, key=lambda j: (-j['priority'], j['enqueued_at']))
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            self._save()
+            return dict(job)
+
+    def finish(self, job_id, status, error=None):
+        with self.lock:
+            for job in self.jobs:
+                if job['id'] == job_id:
+                    job['status'] = status
+                    job['finished_at'] = time.time()
+                    job['error'] = error
+                    break
+            self._prune()
+            self._save()
+
+    def requeue(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job['id'] == job_id:
+                    job['status'] = 'queued'
+                    job['started_at'] = None
+                    break
+            self._save()
+
+    def counts(self):
+        with self.lock:
+            counts = {'queued': 0, 'running': 0, **self.archived_counts}
+            for job in self.jobs:
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+class FolderWatcher:
+    """フォルダをポーリングし、サイズと更新時刻が一定時間変化しなくなった動画を返す"""
+    def __init__(self, folder, stable_seconds):
+        self.folder = folder
+        self.stable_seconds = stable_seconds
+        # path -> (size, mtime_ns, 変化が止まった時刻)
+        self.observed = {}
+
+    def poll(self):
+        ready = []
+        try:
+            entries = list(os.scandir(self.folder['path']))
+        except OSError:
+            return ready
+
+        now = time.time()
+        seen = set()
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            try:
+                # DirEntry.stat() はWindowsではディレクトリのキャッシュ値を返し、書き込み中に更新されないことがあるため使わない
+                stat = os.stat(entry.path)
+            except OSError:
+                continue
+            path = entry.path
+            seen.add(path)
+            prev = self.observed.get(path)
+            if prev is None or prev[0] != stat.st_size or prev[1] != stat.st_mtime_ns:
+                self.observed[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - prev[2] >= self.stable_seconds:
+                ready.append((path, f"{path}|{stat.st_size}|{stat.st_mtime_ns}"))
+
+        for path in list(self.observed):
+            if path not in seen:
+                del self.observed[path]
+        return ready
+
+
+class IngestDaemon:
+    """監視フォルダに置かれた動画を自動でキューに積み、並列数を制限して処理する"""
+    def __init__(self, config, logger=None):
+        self.config = config
+        self.logger = logger or print
+        self.queue = JobQueue(config['queue_file'], config['max_finished_jobs'], self.log)
+        self.watchers = [FolderWatcher(folder, config['stable_seconds']) for folder in config['folders']]
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.running = {}  # job_id -> VideoProcessor
+        self.started_at = time.time()
+        self.completed_count = 0
+        self.stopping = False
+        self.stopped_event = threading.Event()
+        self.console_handler = None
+        # 安定したが書き込み完了を確認できず保留中のファイル (ログを一度だけ出すため)
+        self.held_back = set()
+
+    def log(self, msg):
+        self.logger(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
+
+    def scan(self):
+        for watcher in self.watchers:
+            for path, file_key in watcher.poll():
+                if self.queue.contains(file_key):
+                    continue
+                # サイズが事前確保されたコピーなどは変化が止まって見えるため、書き込み完了を別途確認する
+                if is_file_complete(path):
+                    self.held_back.discard(path)
+                    self.queue.enqueue(path, file_key, watcher.folder)
+                    self.log(f"キューに追加しました: {path}")
+                elif path not in self.held_back:
+                    self.held_back.add(path)
+                    self.log(f"書き込み完了を確認できないため保留します: {path}")
+        # 消えたファイルは保留の記録からも外す
+        self.held_back &= {path for watcher in self.watchers for path in watcher.observed}
+
+    def _dispatch(self):
+        while len(self.running) < self.config['max_concurrent'] and not self.stop_event.is_set():
+            job = self.queue.take_next()
+            if job is None:
+                return
+            preset = self.config['presets'].get(job['preset']) if job['preset'] else None
+            with self.lock:
+                processor = VideoProcessor({})
+                # 開始前に停止要求が来ても取りこぼさないよう、先に中止イベントを用意する
+                processor.cancel_event = threading.Event()
+                self.running[job['id']] = processor
+            threading.Thread(target=self._run_job, args=(job, preset, processor), daemon=True).start()
+
+    def _run_job(self, job, preset, processor):
+        video_path = job['video_path']
+        name = os.path.basename(video_path)
+        errors = []
+        result = {}
+
+        def on_done(success_count, total_tasks, cancelled, output_dir):
+            result.update(success_count=success_count, total_tasks=total_tasks, cancelled=cancelled, output_dir=output_dir)
+
+        processor.callbacks = {
+            'log': lambda msg: None,
+            'error': errors.append,
+            'progress': lambda current, total, msg: None,
+            'done': on_done,
+        }
+        self.log(f"処理開始: {name}")
+        try:
+            if not os.path.exists(video_path):
+                raise FileNotFoundError(video_path)
+            settings, transforms = build_job_settings(preset)
+            processor.run_processing(video_path, transforms, settings)
+        except Exception:
+            errors.append(traceback.format_exc())
+        finally:
+            processor.cleanup()
+
+        with self.lock:
+            self.running.pop(job['id'], None)
+
+        succeeded = bool(result) and result['success_count'] == result['total_tasks']
+        # Ctrl+C ではffmpegが先にSIGINTで異常終了するため、停止中の失敗は中断として扱う
+        if result.get('cancelled') or (self.stop_event.is_set() and not succeeded):
+            # 停止要求による中断は次回起動時にやり直す
+            self.queue.requeue(job['id'])
+            self.log(f"処理を中断しました（次回再実行）: {name}")
+        elif succeeded:
+            self.queue.finish(job['id'], 'done')
+            with self.lock:
+                self.completed_count += 1
+            self.log(f"処理完了: {name} -> {result['output_dir']}")
+        else:
+            error = "\n".join(errors) or "不明なエラー"
+            self.queue.finish(job['id'], 'failed', error)
+            self.log(f"処理失敗: {name}\n{error}")
+
+    def write_status(self):
+        counts = self.queue.counts()
+        elapsed = time.time() - self.started_at
+        with self.lock:
+            running = len(self.running)
+            completed = self.completed_count
+        status = {
+            'updated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'uptime_sec': round(elapsed, 1),
+            'queue_depth': counts['queued'],
+            'running': running,
+            'done': counts['done'],
+            'failed': counts['failed'],
+            'completed_this_session': completed,
+            'throughput_per_hour': round(completed / elapsed * 3600, 2) if elapsed > 0 else 0.0,
+            'max_concurrent': self.config['max_concurrent'],
+            'folders': [folder['path'] for folder in self.config['folders']],
+        }
+        # 監視側のプロセスが読んでいる間は書き込めないことがあるため、失敗しても処理は続ける
+        try:
+            write_json_atomic(self.config['status_file'], status)
+        except OSError as e:
+            self.log(f"ステータスファイルの書き込みに失敗しました: {e}")
+
+    def _install_stop_handlers(self):
+        """サービス停止やコンソールを閉じた場合にも、ffmpegを止めてから終了するようにする"""
+        def on_signal(signum, frame):
+            self.log(f"停止要求を受け付けました。(signal {signum})")
+            self.stop_event.set()
+
+        signal.signal(signal.SIGTERM, on_signal)
+        if hasattr(signal, 'SIGBREAK'):
+            signal.signal(signal.SIGBREAK, on_signal)
+
+        if os.name == 'nt':
+            import ctypes
+            CTRL_CLOSE_EVENT, CTRL_LOGOFF_EVENT, CTRL_SHUTDOWN_EVENT = 2, 5, 6
+
+            def on_console_event(ctrl_type):
+                if ctrl_type not in (CTRL_CLOSE_EVENT, CTRL_LOGOFF_EVENT, CTRL_SHUTDOWN_EVENT):
+                    return False
+                # ハンドラから戻るとプロセスが強制終了されるため、ここで停止完了まで待つ
+                self.stop()
+                return True
+
+            # ガベージコレクトされないよう参照を保持する
+            self.console_handler = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint)(on_console_event)
+            ctypes.windll.kernel32.SetConsoleCtrlHandler(self.console_handler, True)
+
+    def run(self):
+        self.log(f"監視を開始します: {', '.join(f['path'] for f in self.config['folders'])}")
+        self._install_stop_handlers()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.scan()
+                    self._dispatch()
+                except OSError as e:
+                    self.log(f"監視処理中にエラーが発生しました（次回再試行）: {e}")
+                self.write_status()
+                self.stop_event.wait(self.config['poll_interval'])
+        except KeyboardInterrupt:
+            self.log("停止要求を受け付けました。")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.lock:
+            already_stopping = self.stopping
+            self.stopping = True
+        if already_stopping:
+            # 別スレッドで停止処理中の場合は完了を待つ
+            self.stopped_event.wait()
+            return
+        with self.lock:
+            processors = list(self.running.values())
+        for processor in processors:
+            processor.cancel()
+        # 実行中のジョブがキューに戻されるのを待つ
+        while True:
+            with self.lock:
+                if not self.running:
+                    break
+            time.sleep(0.1)
+        self.write_status()
+        self.log("監視を終了しました。")
+        self.stopped_event.set()
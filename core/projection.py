@@ -0,0 +1,143 @@
+import os
+import json
+import subprocess
+from core.ffmpeg_runner import FFmpegRunner
+from constants import LENS_PROFILE_PATH
+
+INPUT_TYPES = ('auto', 'e', 'dfisheye', 'fisheye')
+
+# 魚眼レンズの初期プロファイル
+# ih_fov/iv_fov はレンズ1枚あたりの視野角、offsets は [前, 後] レンズ中心のずれ (レンズ直径に対する比率)
+DEFAULT_LENS_OFFSETS = [[0.0, 0.0], [0.0, 0.0]]
+DEFAULT_LENS_PROFILES = {
+    "標準 (190°)": {'ih_fov': 190.0, 'iv_fov': 190.0, 'offsets': DEFAULT_LENS_OFFSETS},
+    "標準 (180°)": {'ih_fov': 180.0, 'iv_fov': 180.0, 'offsets': DEFAULT_LENS_OFFSETS},
+}
+DEFAULT_LENS_PROFILE = "標準 (190°)"
+
+# レンズ中心のずれとして許容する最大値 (これ以上は切り出し範囲が無くなる)
+MAX_LENS_OFFSET = 0.2
+
+def load_lens_profiles():
+    profiles = dict(DEFAULT_LENS_PROFILES)
+    if os.path.exists(LENS_PROFILE_PATH):
+        try:
+            with open(LENS_PROFILE_PATH, encoding='utf-8') as f:
+                profiles.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"レンズプロファイルの読み込み中にエラー: {e}")
+    return profiles
+
+def save_lens_profile(name, profile):
+    """ユーザー定義のレンズプロファイルを保存する"""
+    user_profiles = {}
+    if os.path.exists(LENS_PROFILE_PATH):
+        with open(LENS_PROFILE_PATH, encoding='utf-8') as f:
+            user_profiles = json.load(f)
+    user_profiles[name] = profile
+    os.makedirs(os.path.dirname(LENS_PROFILE_PATH), exist_ok=True)
+    with open(LENS_PROFILE_PATH, 'w', encoding='utf-8') as f:
+        json.dump(user_profiles, f, ensure_ascii=False, indent=2)
+
+def validate_lens(lens):
+    """レンズ設定を確認し、問題があればエラーメッセージを返す"""
+    try:
+        ih_fov = float(lens['ih_fov'])
+        iv_fov = float(lens['iv_fov'])
+        offsets = [[float(v) for v in o] for o in lens.get('offsets', DEFAULT_LENS_OFFSETS)]
+    except (KeyError, TypeError, ValueError):
+        return "レンズ設定の形式が不正です (ih_fov / iv_fov / offsets)。"
+    if ih_fov <= 0 or iv_fov <= 0:
+        return "視野角は0より大きい値を指定してください。"
+    for offset in offsets:
+        for v in offset:
+            if abs(v) > MAX_LENS_OFFSET:
+                return f"レンズ中心のずれはレンズ直径に対する比率で、±{MAX_LENS_OFFSET} 以内で指定してください (入力値: {v})。"
+    return None
+
+def _looks_like_dual_fisheye(video_path):
+    """1フレーム目を縮小し、左右それぞれのレンズの四隅が黒いかどうかで判定する"""
+    w, h = 64, 32
+    cmd = ['ffmpeg', '-i', video_path, '-vframes', '1', '-vf', f'scale={w}:{h},format=gray',
+           '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1']
+    creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, creationflags=creationflags)
+    data = process.stdout
+    if len(data) < w * h:
+        return False
+
+    def mean(x0, y0, size):
+        values = [data[y * w + x] for y in range(y0, y0 + size) for x in range(x0, x0 + size)]
+        return sum(values) / len(values)
+
+    for ox in (0, h):
+        corners = [mean(ox + x, y, 3) for x in (0, h - 3) for y in (0, h - 3)]
+        center = mean(ox + h // 2 - 4, h // 2 - 4, 8)
+        if max(corners) > 20 or center < max(corners) + 10:
+            return False
+    return True
+
+def resolve_input(video_path, input_type, logger=None):
+    """入力形式と魚眼レンズのストリーム数を決める。'auto' の場合は解像度とストリーム構成から判定する"""
+    if input_type == 'e':
+        return 'e', 1
+    streams = FFmpegRunner.get_video_streams(video_path)
+    # 同じ解像度の映像ストリームが2本ある場合は、レンズごとに分かれたデュアル魚眼とみなす
+    two_streams = len(streams) >= 2 and streams[0] == streams[1]
+
+    if input_type == 'auto':
+        if two_streams:
+            input_type = 'dfisheye'
+        elif streams and streams[0][0] == streams[0][1]:
+            input_type = 'fisheye'
+        elif streams and streams[0][0] == streams[0][1] * 2 and _looks_like_dual_fisheye(video_path):
+            input_type = 'dfisheye'
+        else:
+            input_type = 'e'
+        if logger:
+            logger(f"入力形式を自動判定しました: {input_type} (映像ストリーム: {streams})")
+
+    stream_count = 2 if input_type == 'dfisheye' and two_streams else 1
+    return input_type, stream_count
+
+def _crop_lens(x_origin, margin, offset):
+    """レンズ中心のずれを打ち消すよう、正方形に切り出すcropフィルタ"""
+    scale = 1.0 - 2 * margin
+    dx, dy = offset
+    return (f"crop=w=trunc(ih*{scale:.6f}/2)*2:h=trunc(ih*{scale:.6f}/2)*2"
+            f":x={x_origin}+ih*{margin + dx:.6f}:y=ih*{margin + dy:.6f}")
+
+def build_input_filters(input_type, stream_count, lens):
+    """v360の前段に置くフィルタと、v360の入力オプションを返す。
+    戻り値: (前段フィルタ文字列 or '', v360入力オプション, filter_complexが必要か)"""
+    if input_type == 'e':
+        return '', 'input=e', False
+
+    offsets = [[float(v) for v in o] for o in lens.get('offsets', DEFAULT_LENS_OFFSETS)]
+    lens_count = 2 if input_type == 'dfisheye' else 1
+    offsets = (offsets + [[0.0, 0.0]] * 2)[:lens_count]
+    margin = min(MAX_LENS_OFFSET, max(abs(v) for o in offsets for v in o))
+    offsets = [[max(-margin, min(margin, v)) for v in o] for o in offsets]
+
+    # 切り出した分だけ視野角も狭くなる（等距離射影として近似）
+    scale = 1.0 - 2 * margin
+    ih_fov = float(lens['ih_fov']) * scale
+    iv_fov = float(lens['iv_fov']) * scale
+    v360_input = f"input={input_type}:ih_fov={ih_fov:.3f}:iv_fov={iv_fov:.3f}"
+
+    if stream_count == 2:
+        # レンズごとのストリームを横に並べて1枚のデュアル魚眼にする
+        if margin > 0:
+            pre = (f"[0:v:0]{_crop_lens(0, margin, offsets[0])}[front];"
+                   f"[0:v:1]{_crop_lens(0, margin, offsets[1])}[back];[front][back]hstack")
+        else:
+            pre = "[0:v:0][0:v:1]hstack"
+        return pre, v360_input, True
+
+    if margin == 0:
+        return '', v360_input, False
+    if input_type == 'fisheye':
+        return _crop_lens('(iw-ih)/2', margin, offsets[0]), v360_input, False
+    pre = (f"split=2[front_in][back_in];[front_in]{_crop_lens(0, margin, offsets[0])}[front];"
+           f"[back_in]{_crop_lens('ih', margin, offsets[1])}[back];[front][back]hstack")
+    return pre, v360_input, False
@@ -0,0 +1,113 @@
+import subprocess
+import threading
+import os
+import re
+from PIL import Image, ImageChops, ImageStat
+from constants import MOTION_ANALYSIS_SIZE, MOTION_ANALYSIS_FPS, MOTION_NOISE_FLOOR, MAX_SELECTED_FRAMES
+
+# showinfoのログからフレームのタイムスタンプ(pts_time:12.345)を抽出する正規表現
+pts_time_pattern = re.compile(r"\bn:\s*\d+.*?\bpts_time:\s*(-?\d+(?:\.\d+)?)")
+
+def analyze_motion(video_path, cancel_event=None, logger=None):
+    """縮小したグレースケール映像をデコードし、フレーム間の差分量を (時刻, 差分) のリストで返す。
+    中止された場合は None を返す"""
+    w, h = MOTION_ANALYSIS_SIZE
+    cmd = [
+        'ffmpeg', '-nostats', '-i', video_path, '-an', '-sn',
+        '-vf', f'fps={MOTION_ANALYSIS_FPS},scale={w}:{h},format=gray,showinfo',
+        '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1'
+    ]
+    if logger:
+        logger(f"--- Running 動き解析 Command ---\n{' '.join(cmd)}")
+    creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=creationflags)
+
+    timestamps = []
+    def reader_thread():
+        try:
+            for line in iter(process.stderr.readline, b''):
+                match = pts_time_pattern.search(line.decode('utf-8', errors='replace'))
+                if match:
+                    timestamps.append(float(match.group(1)))
+        finally:
+            process.stderr.close()
+
+    reader = threading.Thread(target=reader_thread)
+    reader.start()
+
+    diffs = []
+    frame_size = w * h
+    prev = None
+    try:
+        while True:
+            if cancel_event and cancel_event.is_set():
+                process.terminate()
+                process.wait()
+                return None
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            frame = Image.frombytes('L', (w, h), data)
+            # 平均絶対差分 (0～255) をフレーム間の動き量とする
+            diffs.append(ImageStat.Stat(ImageChops.difference(frame, prev)).mean[0] if prev else 0.0)
+            prev = frame
+    finally:
+        process.stdout.close()
+        process.wait()
+        reader.join()
+
+    if process.returncode != 0 and not diffs:
+        raise RuntimeError(f"動き解析に失敗しました: {video_path}")
+    # 時刻と差分の対応がずれると誤ったフレームを選ぶため、数が合わなければ中断する
+    if len(timestamps) != len(diffs):
+        raise RuntimeError(f"動き解析のフレーム数が一致しません (タイムスタンプ: {len(timestamps)}, フレーム: {len(diffs)})")
+    return list(zip(timestamps, diffs))
+
+def validate_sampling_settings(settings):
+    """動き適応サンプリングの設定を確認し、問題があればエラーメッセージを返す"""
+    threshold = float(settings['motion_threshold'])
+    min_interval = float(settings['min_interval'])
+    max_interval = float(settings['max_interval'])
+    if threshold <= 0:
+        return "動き閾値は0より大きい値を指定してください。"
+    if not 0 < min_interval <= max_interval:
+        return "間隔は 0 < 最小間隔 <= 最大間隔 となるよう指定してください。"
+    return None
+
+def select_timestamps(motion, threshold, min_interval, max_interval):
+    """累積した動き量が閾値を超えた時点を、最小/最大間隔の範囲で選ぶ"""
+    selected = []
+    accumulated = 0.0
+    last_t = None
+    for t, diff in motion:
+        accumulated += max(0.0, diff - MOTION_NOISE_FLOOR)
+        if last_t is None:
+            # 先頭フレームは必ず出力する
+            selected.append(t)
+            last_t, accumulated = t, 0.0
+            continue
+        elapsed = t - last_t
+        if elapsed < min_interval:
+            continue
+        if accumulated >= threshold or elapsed >= max_interval:
+            selected.append(t)
+            last_t, accumulated = t, 0.0
+    return selected
+
+def build_select_filter(timestamps):
+    """各時刻以降の最初のフレームだけを通す select フィルタを作る。
+    フレームごとの評価が O(log N) になるよう、時刻を二分探索する if() の木にする"""
+    if len(timestamps) > MAX_SELECTED_FRAMES:
+        raise ValueError(f"選択されたフレームが多すぎます ({len(timestamps)} > {MAX_SELECTED_FRAMES})。最小間隔を大きくしてください。")
+    # 表示桁の丸めで次のフレームにずれないよう、わずかに手前から判定する
+    times = [f"{t - 0.0005:.4f}" for t in sorted(timestamps)]
+
+    def node(lo, hi):
+        # times[lo] <= t < times[hi+1] が確定している範囲から、t 以下で最大の時刻を探す
+        if lo == hi:
+            # その時刻以降まだ1枚も選んでいなければ選ぶ
+            return f"not(gte(prev_selected_t,{times[lo]}))"
+        mid = (lo + hi + 1) // 2
+        return f"if(gte(t,{times[mid]}),{node(mid, hi)},{node(lo, mid - 1)})"
+
+    return f"select='if(gte(t,{times[0]}),{node(0, len(times) - 1)},0)'"
@@ -1,4 +1,6 @@
 import os
+import threading
+from collections import OrderedDict
 from PIL import Image
 
 def sanitize_path_for_ffmpeg_filter(path):
@@ -15,4 +17,38 @@ def load_and_resize_image(image_path, size):
         return img
     except Exception as e:
         print(f"画像のリサイズ中にエラー: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def get_image_cache_key(image_path, size):
+    """画像キャッシュのキー (パス, 更新時刻, サイズ) を返す。ファイルが無ければNone"""
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, tuple(size))
+
+class LRUCache:
+    """容量制限付きのスレッドセーフなLRUキャッシュ"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            # 上限を超えた分は古いものから破棄する
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -3,6 +3,7 @@ import os
 from gui.settings_panel import SettingsPanel
 from gui.preview_panel import PreviewPanel
 from core.processor import VideoProcessor
+from core.sampler import validate_sampling_settings
 from constants import (
     COLOR_PREVIEW_NORMAL, COLOR_PREVIEW_HOVER, COLOR_PREVIEW_DISABLED,
     COLOR_RUN_NORMAL, COLOR_RUN_HOVER, COLOR_RUN_DISABLED,
@@ -166,11 +167,21 @@ class App(ctk.CTk):
         self.toggle_log_window()  # エラー時は自動でログウィンドウを開く
         
     def _validate_inputs(self):
-        settings = self.settings_panel.get_settings()
+        try:
+            settings = self.settings_panel.get_settings()
+        except ValueError as e:
+            self.show_error(str(e))
+            return False, None, None
         if not settings['video_path'] or not os.path.exists(settings['video_path']):
             self.show_error("有効な動画ファイルが選択されていません。")
             return False, None, None
         
+        if settings['adaptive_sampling']:
+            err = validate_sampling_settings(settings)
+            if err:
+                self.show_error(err)
+                return False, None, None
+
         transforms = self.settings_panel.get_selected_transforms()
         if not transforms:
             self.show_error("角度が選択されていません。")
@@ -237,4 +248,5 @@ class App(ctk.CTk):
         if self.processor:
             self.processor.cancel()
             self.processor.cleanup()
+        self.preview_panel.shutdown()
         self.destroy()
\ No newline at end of file
@@ -1,24 +1,39 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import customtkinter as ctk
-from core.utils import load_and_resize_image
-from constants import BEFORE_PREVIEW_SIZE, AFTER_PREVIEW_SIZE, MAX_PREVIEWS
+from core.utils import load_and_resize_image, get_image_cache_key, LRUCache
+from constants import (
+    BEFORE_PREVIEW_SIZE, AFTER_PREVIEW_SIZE, MAX_PREVIEWS,
+    THUMBNAIL_WORKERS, THUMBNAIL_CACHE_SIZE, THUMBNAIL_POLL_MS
+)
 
 class PreviewPanel(ctk.CTkScrollableFrame):
     def __init__(self, master, **kwargs):
         super().__init__(master, **kwargs)
-        
+
+        # サムネイルのデコード・リサイズはワーカースレッドで行い、結果をまとめてUIスレッドで反映する
+        self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+        self.image_cache = LRUCache(THUMBNAIL_CACHE_SIZE)
+        self.result_queue = queue.Queue()
+        self.pending_jobs = 0
+        self.drain_scheduled = False
+        # 古い要求の結果を捨てるための世代番号
+        self.before_generation = 0
+        self.after_generation = 0
+
         # 適用前画像
         ctk.CTkLabel(self, text="適用前（元動画の1フレーム目）", font=ctk.CTkFont(weight="bold")).pack(pady=5)
         self.lbl_before = ctk.CTkLabel(self, text="No Image", width=BEFORE_PREVIEW_SIZE[0], height=BEFORE_PREVIEW_SIZE[1], fg_color="gray")
         self.lbl_before.pack(pady=5)
-        
+
         ctk.CTkFrame(self, height=2, fg_color="gray").pack(fill="x", padx=10, pady=10)
-        
+
         # 適用後画像
         ctk.CTkLabel(self, text="適用後プレビュー（選択した視点）", font=ctk.CTkFont(weight="bold")).pack(pady=5)
         self.after_container = ctk.CTkFrame(self, fg_color="transparent")
         self.after_container.pack(fill="both", expand=True)
         self.after_labels = []
-        
+
         for i in range(MAX_PREVIEWS):
             frame = ctk.CTkFrame(self.after_container)
             lbl_text = ctk.CTkLabel(frame, text="")
@@ -27,12 +42,78 @@ class PreviewPanel(ctk.CTkScrollableFrame):
             lbl_img.pack(padx=5, pady=5)
             self.after_labels.append({"frame": frame, "text": lbl_text, "img": lbl_img})
 
-    def update_before_image(self, path):
-        img = load_and_resize_image(path, BEFORE_PREVIEW_SIZE)
-        if img:
-            ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=BEFORE_PREVIEW_SIZE)
+    def _request_image(self, path, size, target):
+        """キャッシュにあれば即座に反映し、無ければワーカーにデコードを依頼する"""
+        key = get_image_cache_key(path, size)
+        if key is None:
+            return
+        ctk_img = self.image_cache.get(key)
+        if ctk_img:
+            self._apply_image(target, ctk_img)
+            return
+
+        def job():
+            return load_and_resize_image(path, size)
+
+        def on_done(future):
+            # ワーカースレッドから呼ばれるため、キューに積むだけにする
+            try:
+                img = future.result()
+            except Exception as e:
+                print(f"サムネイル生成中にエラー: {e}")
+                img = None
+            self.result_queue.put((target, key, size, img))
+
+        self.pending_jobs += 1
+        self.executor.submit(job).add_done_callback(on_done)
+        self._schedule_drain()
+
+    def _schedule_drain(self):
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            self.after(THUMBNAIL_POLL_MS, self._drain_results)
+
+    def _drain_results(self):
+        """完了したサムネイルをまとめてUIに反映する"""
+        self.drain_scheduled = False
+        while True:
+            try:
+                target, key, size, img = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.pending_jobs -= 1
+            if img is None:
+                continue
+            ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=size)
+            self.image_cache.put(key, ctk_img)
+            self._apply_image(target, ctk_img)
+
+        if self.pending_jobs > 0:
+            self._schedule_drain()
+
+    def _apply_image(self, target, ctk_img):
+        if target[0] == "before":
+            _, generation = target
+            if generation != self.before_generation:
+                return
             self.lbl_before.configure(image=ctk_img, text="")
             self.lbl_before.image = ctk_img
+        else:
+            _, generation, i, yaw, pitch = target
+            if generation != self.after_generation:
+                return
+            columns = 2
+            item = self.after_labels[i]
+            item["img"].configure(image=ctk_img, text="")
+            item["img"].image = ctk_img
+            item["text"].configure(text=f"Yaw:{yaw}, Pitch:{pitch}")
+
+            row, col = divmod(i, columns)
+            item["frame"].grid(row=row, column=col, padx=5, pady=5)
+
+    def update_before_image(self, path):
+        self.before_generation += 1
+        self._request_image(path, BEFORE_PREVIEW_SIZE, ("before", self.before_generation))
 
     def clear_after_images(self):
         for item in self.after_labels:
@@ -42,17 +123,11 @@ class PreviewPanel(ctk.CTkScrollableFrame):
 
     def update_after_images(self, preview_data):
         self.clear_after_images()
-        columns = 2
+        self.after_generation += 1
         for i, (yaw, pitch, path) in enumerate(preview_data):
             if i >= MAX_PREVIEWS: break
-            
-            img = load_and_resize_image(path, AFTER_PREVIEW_SIZE)
-            if img:
-                ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=AFTER_PREVIEW_SIZE)
-                item = self.after_labels[i]
-                item["img"].configure(image=ctk_img, text="")
-                item["img"].image = ctk_img
-                item["text"].configure(text=f"Yaw:{yaw}, Pitch:{pitch}")
-                
-                row, col = divmod(i, columns)
-                item["frame"].grid(row=row, column=col, padx=5, pady=5)
\ No newline at end of file
+            self._request_image(path, AFTER_PREVIEW_SIZE, ("after", self.after_generation, i, yaw, pitch))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.image_cache.clear()
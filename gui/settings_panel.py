@@ -1,6 +1,14 @@
 import customtkinter as ctk
-from tkinter import filedialog
+from tkinter import filedialog, messagebox
 from constants import HORIZONTAL_ANGLES, VERTICAL_ANGLES
+from core.projection import load_lens_profiles, save_lens_profile, validate_lens, DEFAULT_LENS_PROFILE, DEFAULT_LENS_OFFSETS
+
+INPUT_TYPE_LABELS = {
+    "正距円筒 (equirect)": 'e',
+    "デュアル魚眼": 'dfisheye',
+    "魚眼 (1レンズ)": 'fisheye',
+    "自動判定": 'auto',
+}
 
 class SettingsPanel(ctk.CTkScrollableFrame):
     def __init__(self, master, **kwargs):
@@ -8,10 +16,22 @@ class SettingsPanel(ctk.CTkScrollableFrame):
         
         self.video_path_var = ctk.StringVar()
         self.lut_path_var = ctk.StringVar()
+
+        self.input_type_var = ctk.StringVar(value="正距円筒 (equirect)")
+        self.lens_profiles = load_lens_profiles()
+        self.lens_profile_var = ctk.StringVar(value=DEFAULT_LENS_PROFILE)
+        self.ih_fov_var = ctk.StringVar()
+        self.iv_fov_var = ctk.StringVar()
+        # [前, 後] レンズの中心ずれ (X, Y)
+        self.lens_offset_vars = [[ctk.StringVar(), ctk.StringVar()] for _ in range(2)]
         
         self.fov_var = ctk.DoubleVar(value=90.0)
         self.size_var = ctk.StringVar(value="1920")
         self.fps_var = ctk.StringVar(value="1.0")
+        self.adaptive_var = ctk.BooleanVar(value=False)
+        self.motion_threshold_var = ctk.StringVar(value="10.0")
+        self.min_interval_var = ctk.StringVar(value="0.25")
+        self.max_interval_var = ctk.StringVar(value="5.0")
         
         self.saturation_var = ctk.DoubleVar(value=1.0)
         self.contrast_var = ctk.DoubleVar(value=1.0)
@@ -30,6 +50,27 @@ class SettingsPanel(ctk.CTkScrollableFrame):
         ctk.CTkEntry(file_frame, textvariable=self.video_path_var, state="readonly", width=200).pack(side="left", fill="x", expand=True, padx=5)
         ctk.CTkButton(file_frame, text="選択...", width=60, command=self._browse_video).pack(side="left")
 
+        input_frame = ctk.CTkFrame(self, fg_color="transparent")
+        input_frame.pack(fill="x", padx=10, pady=5)
+        ctk.CTkLabel(input_frame, text="入力形式").grid(row=0, column=0, sticky="e", padx=5, pady=5)
+        ctk.CTkOptionMenu(input_frame, variable=self.input_type_var, values=list(INPUT_TYPE_LABELS)).grid(row=0, column=1, columnspan=2, sticky="w", padx=5, pady=5)
+
+        # 魚眼入力用のレンズプロファイル
+        ctk.CTkLabel(input_frame, text="レンズ").grid(row=1, column=0, sticky="e", padx=5, pady=5)
+        self.lens_profile_box = ctk.CTkComboBox(input_frame, variable=self.lens_profile_var, values=list(self.lens_profiles),
+                                                command=self._apply_lens_profile, width=180)
+        self.lens_profile_box.grid(row=1, column=1, columnspan=2, sticky="w", padx=5, pady=5)
+        ctk.CTkButton(input_frame, text="プロファイル保存", width=100, command=self._save_lens_profile).grid(row=1, column=3, sticky="w", padx=5, pady=5)
+
+        ctk.CTkLabel(input_frame, text="視野角 H/V").grid(row=2, column=0, sticky="e", padx=5, pady=5)
+        ctk.CTkEntry(input_frame, textvariable=self.ih_fov_var, width=80).grid(row=2, column=1, sticky="w", padx=5, pady=5)
+        ctk.CTkEntry(input_frame, textvariable=self.iv_fov_var, width=80).grid(row=2, column=2, sticky="w", padx=5, pady=5)
+        for i, label in enumerate(["前レンズずれ X/Y (直径比)", "後レンズずれ X/Y (直径比)"]):
+            ctk.CTkLabel(input_frame, text=label).grid(row=3 + i, column=0, sticky="e", padx=5, pady=5)
+            for j, var in enumerate(self.lens_offset_vars[i]):
+                ctk.CTkEntry(input_frame, textvariable=var, width=80).grid(row=3 + i, column=1 + j, sticky="w", padx=5, pady=5)
+        self._apply_lens_profile(DEFAULT_LENS_PROFILE)
+
         ctk.CTkFrame(self, height=2, fg_color="gray").pack(fill="x", padx=10, pady=10)
 
         # 2. 切り出し設定
@@ -59,6 +100,15 @@ class SettingsPanel(ctk.CTkScrollableFrame):
         ctk.CTkLabel(param_frame, text="出力FPS").grid(row=2, column=0, sticky="e", padx=5, pady=5)
         ctk.CTkEntry(param_frame, textvariable=self.fps_var, width=80).grid(row=2, column=1, sticky="w", padx=5, pady=5)
 
+        # 動き適応サンプリング (有効時は出力FPSの代わりに使用)
+        ctk.CTkCheckBox(param_frame, text="動き適応サンプリング (出力FPSの代わりに使用)", variable=self.adaptive_var).grid(row=3, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        ctk.CTkLabel(param_frame, text="動き閾値").grid(row=4, column=0, sticky="e", padx=5, pady=5)
+        ctk.CTkEntry(param_frame, textvariable=self.motion_threshold_var, width=80).grid(row=4, column=1, sticky="w", padx=5, pady=5)
+        ctk.CTkLabel(param_frame, text="最小間隔(秒)").grid(row=5, column=0, sticky="e", padx=5, pady=5)
+        ctk.CTkEntry(param_frame, textvariable=self.min_interval_var, width=80).grid(row=5, column=1, sticky="w", padx=5, pady=5)
+        ctk.CTkLabel(param_frame, text="最大間隔(秒)").grid(row=6, column=0, sticky="e", padx=5, pady=5)
+        ctk.CTkEntry(param_frame, textvariable=self.max_interval_var, width=80).grid(row=6, column=1, sticky="w", padx=5, pady=5)
+
         ctk.CTkFrame(self, height=2, fg_color="gray").pack(fill="x", padx=10, pady=10)
 
         # 3. 色調整設定
@@ -103,6 +153,51 @@ class SettingsPanel(ctk.CTkScrollableFrame):
         path = filedialog.askopenfilename(filetypes=[("Cube LUT", "*.cube")])
         if path: self.lut_path_var.set(path)
 
+    def _apply_lens_profile(self, name):
+        profile = self.lens_profiles.get(name)
+        if not profile:
+            return
+        self.ih_fov_var.set(str(profile.get('ih_fov', '')))
+        self.iv_fov_var.set(str(profile.get('iv_fov', '')))
+        for offset_vars, offset in zip(self.lens_offset_vars, profile.get('offsets', DEFAULT_LENS_OFFSETS)):
+            for var, value in zip(offset_vars, offset):
+                var.set(str(value))
+
+    def _get_lens(self):
+        offsets = []
+        for label, offset_vars in zip(["前レンズずれ", "後レンズずれ"], self.lens_offset_vars):
+            # 空欄はずれ無しとして扱う
+            offsets.append([self._parse_float(var, label) if var.get().strip() else 0.0 for var in offset_vars])
+        lens = {
+            'ih_fov': self._parse_float(self.ih_fov_var, "水平視野角"),
+            'iv_fov': self._parse_float(self.iv_fov_var, "垂直視野角"),
+            'offsets': offsets,
+        }
+        err = validate_lens(lens)
+        if err:
+            raise ValueError(err)
+        return lens
+
+    def _save_lens_profile(self):
+        name = self.lens_profile_var.get().strip()
+        if not name:
+            return
+        try:
+            lens = self._get_lens()
+            save_lens_profile(name, lens)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("レンズプロファイル", f"保存できませんでした: {e}")
+            return
+        self.lens_profiles[name] = lens
+        self.lens_profile_box.configure(values=list(self.lens_profiles))
+
+    def _parse_float(self, variable, label):
+        value = variable.get().strip()
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"{label}の値が不正です: '{value}'")
+
     def _toggle_color_settings(self):
         if self.color_settings_visible:
             self.color_frame.pack_forget()
@@ -121,12 +216,22 @@ class SettingsPanel(ctk.CTkScrollableFrame):
         return transforms
 
     def get_settings(self):
+        input_type = INPUT_TYPE_LABELS[self.input_type_var.get()]
+        adaptive = self.adaptive_var.get()
         return {
             'video_path': self.video_path_var.get(),
+            'input_type': input_type,
+            # 正距円筒ではレンズ設定を使わないため、入力欄の内容は確認しない
+            'lens': self._get_lens() if input_type != 'e' else None,
             'lut_path': self.lut_path_var.get(),
             'fov': self.fov_var.get(),
             'size': int(self.size_var.get() or 1920),
             'fps': self.fps_var.get() or "2.0",
+            'adaptive_sampling': adaptive,
+            # 動き適応サンプリングを使わない場合は入力欄の内容を確認しない
+            'motion_threshold': self._parse_float(self.motion_threshold_var, "動き閾値") if adaptive else None,
+            'min_interval': self._parse_float(self.min_interval_var, "最小間隔") if adaptive else None,
+            'max_interval': self._parse_float(self.max_interval_var, "最大間隔") if adaptive else None,
             'saturation': self.saturation_var.get(),
             'contrast': self.contrast_var.get(),
             'brightness': self.brightness_var.get(),
@@ -1,5 +1,14 @@
-from gui.app import App
+import argparse
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="360度動画 アライメント前処理ツール")
+    parser.add_argument("--watch", metavar="CONFIG", help="監視フォルダ取り込みモードで起動する（設定JSONのパス）")
+    args = parser.parse_args()
+
+    if args.watch:
+        from core.ingest import IngestDaemon, load_config
+        IngestDaemon(load_config(args.watch)).run()
+    else:
+        from gui.app import App
+        app = App()
+        app.mainloop()
\ No newline at end of file